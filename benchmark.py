@@ -0,0 +1,70 @@
+import sys
+import time
+
+import numpy as np
+
+from config import tomato_model_config
+from manager import Detector
+from preprocessing import preprocess
+
+
+def _timed(function, frames):
+    """Runs the function for each frame and returns the total time in seconds and the summed speed of the results"""
+    speed = {'preprocess': 0.0, 'inference': 0.0, 'postprocess': 0.0}
+    start = time.perf_counter()
+    for frame in frames:
+        for results in function(frame):
+            for key in speed:
+                speed[key] += results[0].speed.get(key) or 0.0
+    return time.perf_counter() - start, speed
+
+
+def benchmark_shared_preprocessing(frame_count: int = 50, width: int = 1920, height: int = 1080):
+    """
+    Compares running both models on the raw frame (each model preprocesses it on its own)
+    against preprocessing the frame once and passing the same tensor to both models
+    :param frame_count: Number of synthetic frames to run
+    :param width: Width of the synthetic frames
+    :param height: Height of the synthetic frames
+    :return:
+    """
+    size_detection = Detector(weights_path=tomato_model_config.size_tomato_model_path)
+    disease_detection = Detector(weights_path=tomato_model_config.disease_tomato_model_path)
+    if size_detection.imgsz is None or size_detection.imgsz != disease_detection.imgsz:
+        print('Models use different input sizes, there is nothing to share!')
+        return
+
+    frames = [np.random.randint(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(frame_count)]
+    size = size_detection.imgsz
+
+    def separate(frame):
+        return [disease_detection.model(frame, verbose=False), size_detection.model(frame, verbose=False)]
+
+    def shared(frame):
+        tensor = preprocess(frame, size)
+        return [disease_detection.model(tensor, verbose=False), size_detection.model(tensor, verbose=False)]
+
+    # Warm up both paths so model loading does not count
+    separate(frames[0])
+    shared(frames[0])
+
+    shared_preprocess_start = time.perf_counter()
+    for frame in frames:
+        preprocess(frame, size)
+    shared_preprocess_time = time.perf_counter() - shared_preprocess_start
+
+    separate_time, separate_speed = _timed(separate, frames)
+    shared_time, shared_speed = _timed(shared, frames)
+    shared_speed['preprocess'] += shared_preprocess_time * 1000
+
+    print(f'Frames: {frame_count} ({width}x{height}), model input size: {size}')
+    print(f'Separate preprocessing: {separate_time:.2f}s total, '
+          f'{separate_speed["preprocess"] / frame_count:.2f}ms preprocessing per frame')
+    print(f'Shared preprocessing:   {shared_time:.2f}s total, '
+          f'{shared_speed["preprocess"] / frame_count:.2f}ms preprocessing per frame')
+    print(f'Saved: {(separate_time - shared_time) / frame_count * 1000:.2f}ms per frame')
+
+
+if __name__ == '__main__':
+    # Usage: python benchmark.py [frame count]
+    benchmark_shared_preprocessing(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
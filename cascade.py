@@ -0,0 +1,137 @@
+import random
+import time
+
+from ultralytics import YOLO
+
+from config import cascade_config, tomato_model_config
+
+
+class CascadeGate:
+    """
+    A fast first pass which decides if the full detectors have to run on a frame.
+    Note: If no gate model is configured, the full models are reused at a lower input size
+    :param models: Models to reuse when there is no dedicated gate model (usually the disease and size models)
+    """
+
+    def __init__(self, models: list = None):
+        if cascade_config.gate_model:
+            self.models = [YOLO(cascade_config.gate_model, tomato_model_config.device)]
+        else:
+            self.models = models or []
+        self.image_size = cascade_config.image_size
+        self.score = cascade_config.score
+        self.ignore_classes = [name.strip().lower() for name in cascade_config.ignore_classes.split(',') if name.strip()]
+        self.audit_ratio = cascade_config.audit_ratio
+        self.report_every = cascade_config.report_every
+
+        self.frames = 0
+        self.passed = 0  # frames on which the full detectors ran because of the gate
+        self.skipped = 0  # frames the gate did not flag
+        self.flagged = 0  # passed frames on which the full detectors found disease or ready tomatoes
+        self.audited = 0  # not flagged frames on which the full detectors ran anyway (audit or scheduled state)
+        self.missed = 0  # audited frames on which the full detectors found something
+        self.gate_seconds = 0.0
+        self.full_seconds = 0.0
+        self.full_runs = 0
+
+    def _is_flagged(self, class_name: str) -> bool:
+        class_name = class_name.lower()
+        return not any(ignored in class_name for ignored in self.ignore_classes)
+
+    def _max_score(self, frame) -> float:
+        best = 0.0
+        for model in self.models:
+            for result in model(frame, imgsz=self.image_size, verbose=False):
+                if result.probs is not None:
+                    # Classifier: sum of the probabilities of the flagged classes
+                    probabilities = result.probs.data.tolist()
+                    best = max(best, sum(p for i, p in enumerate(probabilities) if self._is_flagged(model.names[i])))
+                    continue
+                for box in result.boxes:
+                    if self._is_flagged(model.names[int(box.cls)]):
+                        best = max(best, box.conf.item())
+        return best
+
+    def passes(self, frame) -> bool:
+        """
+        Runs the gate on the frame
+        :param frame: BGR image as numpy array
+        :return: True if the full detectors have to run
+        """
+        start = time.perf_counter()
+        passed = self._max_score(frame) >= self.score
+        self.gate_seconds += time.perf_counter() - start
+
+        self.frames += 1
+        if passed:
+            self.passed += 1
+        else:
+            self.skipped += 1
+
+        if self.report_every > 0 and self.frames % self.report_every == 0:
+            self.report()
+        return passed
+
+    def should_audit(self) -> bool:
+        """
+        :return: True if a skipped frame should still go through the full detectors to check the gate
+        """
+        return random.random() < self.audit_ratio
+
+    def track_full(self, seconds: float, found: bool, audited: bool = False):
+        """
+        Records a run of the full detectors
+        :param seconds: How long the full detectors took
+        :param found: Whether they found disease or ready tomatoes
+        :param audited: Whether the frame was not flagged by the gate and ran only for the audit or the scheduled state
+        """
+        self.full_seconds += seconds
+        self.full_runs += 1
+        if audited:
+            self.audited += 1
+            self.missed += int(found)
+        else:
+            self.flagged += int(found)
+
+    def report(self) -> dict:
+        """
+        Prints and returns how often the gate short-circuits and what it costs in accuracy.
+        Only the frames on which the full detectors did not run count as short-circuited, and the
+        cost per frame includes the audited frames.
+        Recall is estimated from the audited frames, so it needs audit_ratio above 0
+        :return: Dictionary with the statistics
+        """
+        gate_ms = self.gate_seconds / self.frames * 1000 if self.frames else 0.0
+        full_ms = self.full_seconds / self.full_runs * 1000 if self.full_runs else 0.0
+        short_circuited = self.skipped - self.audited
+        skip_rate = short_circuited / self.frames if self.frames else 0.0
+        cascade_ms = gate_ms + (1 - skip_rate) * full_ms
+        estimated_misses = self.missed / self.audited * self.skipped if self.audited else None
+        recall = None
+        if estimated_misses is not None and self.flagged + estimated_misses > 0:
+            recall = self.flagged / (self.flagged + estimated_misses)
+
+        stats = {
+            'frames': self.frames,
+            'skipped': short_circuited,
+            'skip_rate': skip_rate,
+            'gate_ms': gate_ms,
+            'full_ms': full_ms,
+            'speedup': full_ms / cascade_ms if cascade_ms > 0 else None,
+            'precision': self.flagged / self.passed if self.passed else None,
+            'audited': self.audited,
+            'missed': self.missed,
+            'recall': recall,
+        }
+
+        print(f'Cascade: {short_circuited}/{self.frames} frames short-circuited ({skip_rate:.1%}), '
+              f'{self.audited} audited, gate {gate_ms:.1f}ms, full detectors {full_ms:.1f}ms per frame')
+        if stats['speedup'] is not None:
+            print(f'Cascade: {cascade_ms:.1f}ms per frame on average (with audits), '
+                  f'{stats["speedup"]:.2f}x faster than without gate')
+        if stats['precision'] is not None:
+            print(f'Cascade: {stats["precision"]:.1%} of the passed frames had disease or ready tomatoes')
+        if recall is not None:
+            print(f'Cascade: {self.missed}/{self.audited} audited skipped frames were missed, '
+                  f'estimated recall {recall:.1%}')
+        return stats
@@ -60,3 +60,5 @@ def draw_chart(data: dict, show: bool = False, image: str = None,
         chart_path = os.path.join(save_path, subfolder_name, f'{file_name}')
         plt.savefig(chart_path, dpi=300)
         print(f"Chart saved at: {chart_path}")
+
+    plt.close()
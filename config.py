@@ -54,6 +54,9 @@ class TomatoModelConfig:
 
         self.size_tomato_ripened_count: int = config.get('size_ripened_count', 10, type='int')
 
+        self.image_size: int = config.get('image_size', 640, type='int')
+        self.shared_preprocessing: bool = config.get('shared_preprocessing', False, type='bool')
+
         self.source: str = config.get('input', 'test_inputs/')
         self.output_folder: str = config.get('output', 'test_results/')
 
@@ -62,6 +65,8 @@ class TomatoModelConfig:
         if self.use_minutes:
             self.cooldown: int = self.cooldown * 60
 
+        self.alert_cooldown: int = config.get('alert_cooldown', 3600, type='int')
+
         self.show_stream: bool = config.get('show_stream', True, type='bool')
         self.save_images: bool = config.get('save_images', True, type='bool')
 
@@ -119,11 +124,67 @@ class FTPConfig:
         self.password: str = config.get('password', 'password')
 
 
+class ForecastConfig:
+    def __init__(self):
+        config = Config('forecast')
+
+        self.window: int = config.get('window', 14, type='int')
+        self.horizon_days: int = config.get('horizon_days', 7, type='int')
+        self.default_green_rate: float = config.get('default_green_rate', 0.07, type='float')
+        self.default_half_rate: float = config.get('default_half_rate', 0.17, type='float')
+
+
+class MemoryConfig:
+    def __init__(self):
+        config = Config('memory')
+
+        self.long_running: bool = config.get('long_running', False, type='bool')
+        self.budget_mb: int = config.get('budget_mb', 2048, type='int')
+        self.warn_ratio: float = config.get('warn_ratio', 0.8, type='float')
+        self.shed_ratio: float = config.get('shed_ratio', 0.95, type='float')
+        self.session_recycle: int = config.get('session_recycle', 100, type='int')
+        self.status_interval: int = config.get('status_interval', 600, type='int')
+        self.use_tracemalloc: bool = config.get('tracemalloc', False, type='bool')
+        self.snapshot_folder: str = config.get('snapshot_folder', 'memory_snapshots')
+
+
+class RecorderConfig:
+    def __init__(self):
+        config = Config('recorder')
+
+        self.use_recorder: bool = config.get('use_recorder', False, type='bool')
+        self.pre_seconds: int = config.get('pre_seconds', 10, type='int')
+        self.post_seconds: int = config.get('post_seconds', 10, type='int')
+        self.fps: int = config.get('fps', 5, type='int')
+        self.quality: int = config.get('quality', 80, type='int')
+        self.budget_mb: int = config.get('budget_mb', 64, type='int')
+        self.max_pending_clips: int = config.get('max_pending_clips', 4, type='int')
+        self.output: str = config.get('output', 'test_results/clips')
+
+
+class CascadeConfig:
+    def __init__(self):
+        config = Config('cascade')
+
+        self.use_cascade: bool = config.get('use_cascade', False, type='bool')
+        self.gate_model: str = config.get('gate_model', '')
+        self.image_size: int = config.get('image_size', 320, type='int')
+        self.score: float = config.get('score', 0.25, type='float')
+        self.ignore_classes: str = config.get('ignore_classes', 'Healthy, green')
+        self.audit_ratio: float = config.get('audit_ratio', 0.05, type='float')
+        self.report_every: int = config.get('report_every', 100, type='int')
+        self.state_interval: int = config.get('state_interval', 3600, type='int')
+
+
 tomato_model_config = TomatoModelConfig()
 chart_config = ChartConfig()
 email_config = EmailConfig()
 database_config = DatabaseConfig()
 ftp_config = FTPConfig()
+forecast_config = ForecastConfig()
+memory_config = MemoryConfig()
+recorder_config = RecorderConfig()
+cascade_config = CascadeConfig()
 
 if __name__ == '__main__':
     print(tomato_model_config.save_images)
@@ -4,7 +4,7 @@ from sqlalchemy import create_engine, Column, Integer, String, Date
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-from config import database_config
+from config import database_config, memory_config
 
 Base = declarative_base()
 
@@ -45,10 +45,21 @@ class Writer:
             return
 
         self.engine = create_engine(database_config.URL)
-        session = sessionmaker(bind=self.engine)
-        self.session = session()
+        self.session_factory = sessionmaker(bind=self.engine)
+        self.session = self.session_factory()
+        self.writes = 0  # writes since the session was created
         Base.metadata.create_all(self.engine)
 
+    def recycle_session(self):
+        """
+        Closes the current session and opens a new one, so objects kept by the old one can be freed
+        """
+        if not database_config.use_database:
+            return
+        self.session.close()
+        self.session = self.session_factory()
+        self.writes = 0
+
     def ping(self):
         self.engine = create_engine(database_config.URL)
 
@@ -79,6 +90,10 @@ class Writer:
             self.session.rollback()
             print(f"Error adding data to {table.__tablename__}: {e}")
 
+        self.writes += 1
+        if memory_config.long_running and 0 < memory_config.session_recycle <= self.writes:
+            self.recycle_session()
+
 
 writer = Writer()
 
@@ -0,0 +1,225 @@
+import datetime
+
+import numpy as np
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import database_config, forecast_config
+from database import writer, Growth
+
+GREEN, HALF, READY = 0, 1, 2
+
+
+class HarvestForecaster:
+    """
+    Keeps per-area ripening-rate state and forecasts how many tomatoes will be ready in the next days.
+    Note: State is updated incrementally from each new growth record, the database table is read only once at startup.
+    Every area owns a row in fixed size NumPy arrays which hold a rolling window of daily buckets.
+    All samples of the same day are averaged into one bucket, so detector noise between frames does not count as growth
+    :param window: Number of last days per area used to estimate the ripening rates
+    :param horizon: Number of days to forecast
+    :param capacity: Initial number of area rows, grows automatically when more areas are seen
+    """
+
+    def __init__(self, window: int = None, horizon: int = None, capacity: int = 64):
+        self.window = max(2, window if window is not None else forecast_config.window)
+        self.horizon = max(1, horizon if horizon is not None else forecast_config.horizon_days)
+        self.default_green_rate = forecast_config.default_green_rate
+        self.default_half_rate = forecast_config.default_half_rate
+
+        self.area_index = {}  # {area: row}
+        self.areas = []
+
+        self._days = np.zeros((capacity, self.window), dtype=np.int64)  # day ordinal of each bucket
+        self._counts = np.zeros((capacity, self.window, 3), dtype=np.float64)  # mean green, half, ready of the day
+        self._samples = np.zeros(capacity, dtype=np.int64)  # samples averaged into the newest bucket
+        self._head = np.zeros(capacity, dtype=np.int64)  # next slot to write in the ring
+        self._filled = np.zeros(capacity, dtype=np.int64)
+        self._rates = np.empty((capacity, 2), dtype=np.float64)  # green->half, half->ready per day
+        self._rates[:] = (self.default_green_rate, self.default_half_rate)
+
+    def _grow(self):
+        """Doubles the capacity of all state arrays"""
+        used = len(self.areas)
+        capacity = len(self._head) * 2
+        self._days = np.resize(self._days, (capacity, self.window))
+        self._counts = np.resize(self._counts, (capacity, self.window, 3))
+        self._samples = np.resize(self._samples, capacity)
+        self._head = np.resize(self._head, capacity)
+        self._filled = np.resize(self._filled, capacity)
+        rates = np.empty((capacity, 2), dtype=np.float64)
+        rates[:] = (self.default_green_rate, self.default_half_rate)
+        rates[:used] = self._rates[:used]
+        self._rates = rates
+        self._samples[used:] = 0
+        self._head[used:] = 0
+        self._filled[used:] = 0
+
+    def _row(self, area: str) -> int:
+        row = self.area_index.get(area)
+        if row is None:
+            if len(self.areas) == len(self._head):
+                self._grow()
+            row = len(self.areas)
+            self.area_index[area] = row
+            self.areas.append(area)
+        return row
+
+    @staticmethod
+    def _to_day(date) -> int:
+        if isinstance(date, str):
+            date = datetime.datetime.strptime(date, '%Y-%m-%d %H:%M:%S')
+        return date.toordinal()
+
+    def update(self, area: str, date, green: int, half: int, ready: int):
+        """
+        Adds a single growth sample to the bucket of its day and refreshes only that area's ripening rates
+        :param area: Name of the area
+        :param date: Date of the sample as datetime, date or string in format '%Y-%m-%d %H:%M:%S'
+        :param green: Count of green tomatoes
+        :param half: Count of half ripened tomatoes
+        :param ready: Count of fully ripened tomatoes
+        :return:
+        """
+        row = self._row(area)
+        day = self._to_day(date)
+        sample = np.array((green, half, ready), dtype=np.float64)
+        newest = (self._head[row] - 1) % self.window
+
+        if self._filled[row] and day == self._days[row, newest]:
+            # Same day, update the running mean of the bucket
+            self._samples[row] += 1
+            self._counts[row, newest] += (sample - self._counts[row, newest]) / self._samples[row]
+        elif self._filled[row] and day < self._days[row, newest]:
+            return  # older than the newest bucket, it can not be placed in the ring anymore
+        else:
+            head = self._head[row]
+            self._days[row, head] = day
+            self._counts[row, head] = sample
+            self._samples[row] = 1
+            self._head[row] = (head + 1) % self.window
+            self._filled[row] = min(self._filled[row] + 1, self.window)
+
+        self._estimate_rates(row)
+
+    def load_history(self) -> int:
+        """
+        Loads the growth records of the last `window` days from the database, so the rates survive a restart.
+        Note: Call it once at startup, it runs a single query bounded by the window
+        :return: Number of loaded records
+        """
+        if not database_config.use_database:
+            return 0
+
+        start = datetime.date.today() - datetime.timedelta(days=self.window - 1)
+        session = writer.session_factory()
+        count = 0
+        try:
+            records = session.query(Growth.area, Growth.date, Growth.green_count,
+                                    Growth.half_ripened_count, Growth.fully_ripened_count) \
+                .filter(Growth.date >= start) \
+                .order_by(Growth.date, Growth.id)
+            for area, date, green, half, ready in records.yield_per(1000):
+                self.update(area, date, green or 0, half or 0, ready or 0)
+                count += 1
+        except SQLAlchemyError as e:
+            print(f'Error loading growth history for the harvest forecast: {e}')
+        finally:
+            session.close()
+
+        print(f'Loaded {count} growth records of the last {self.window} days into the harvest forecast')
+        return count
+
+    def _estimate_rates(self, row: int):
+        """
+        Fits the daily transition rates of one area over its window with least squares on the net changes
+        between the daily buckets:
+            change of ready ~ half_rate * half * days
+            change of half + ready ~ green_rate * green * days
+        The fit goes through zero and the result is limited between 0 and 1
+        """
+        filled = self._filled[row]
+        if filled < 2:
+            return
+
+        # Order the ring buffer from the oldest to the newest bucket
+        order = (self._head[row] - filled + np.arange(filled)) % self.window
+        days = self._days[row, order].astype(np.float64)
+        counts = self._counts[row, order]
+
+        dt = np.diff(days)
+        before = counts[:-1]
+        after = counts[1:]
+
+        half_exposure = before[:, HALF] * dt
+        ready_change = after[:, READY] - before[:, READY]
+        green_exposure = before[:, GREEN] * dt
+        half_change = (after[:, HALF] + after[:, READY]) - (before[:, HALF] + before[:, READY])
+
+        denominator = half_exposure @ half_exposure
+        if denominator > 0:
+            self._rates[row, 1] = np.clip((half_exposure @ ready_change) / denominator, 0.0, 1.0)
+        denominator = green_exposure @ green_exposure
+        if denominator > 0:
+            self._rates[row, 0] = np.clip((green_exposure @ half_change) / denominator, 0.0, 1.0)
+
+    def predict(self, areas: list = None, days: int = None) -> dict:
+        """
+        Forecasts the cumulative count of ready tomatoes for each of the next days.
+        All requested areas are simulated together in vectorized form
+        :param areas: (Optional) List of area names. Defaults to all known areas
+        :param days: (Optional) Number of days to forecast. Defaults to the configured horizon
+        :return: Dictionary in format {area: numpy array with predicted ready count for day 1..days}
+        """
+        days = days if days is not None else self.horizon
+        if areas is None:
+            areas = self.areas
+        areas = [area for area in areas if area in self.area_index]
+        if not areas:
+            return {}
+
+        rows = np.fromiter((self.area_index[area] for area in areas), dtype=np.int64, count=len(areas))
+        latest = self._counts[rows, (self._head[rows] - 1) % self.window]
+        green = latest[:, GREEN].copy()
+        half = latest[:, HALF].copy()
+        ready = latest[:, READY].copy()
+        green_rate = self._rates[rows, 0]
+        half_rate = self._rates[rows, 1]
+
+        forecast = np.empty((len(areas), days), dtype=np.float64)
+        for day in range(days):
+            to_half = green * green_rate
+            to_ready = half * half_rate
+            green -= to_half
+            half += to_half - to_ready
+            ready += to_ready
+            forecast[:, day] = ready
+
+        return dict(zip(areas, np.rint(forecast).astype(np.int64)))
+
+    def ready_on(self, area: str, date):
+        """
+        Returns the predicted count of ready tomatoes in the area on the given date
+        :param area: Name of the area
+        :param date: The date for which to get the prediction
+        :return: Predicted count (int) or None if the area is unknown or the date is outside the horizon
+        """
+        if isinstance(date, datetime.datetime):
+            date = date.date()
+        days = (date - datetime.datetime.now().date()).days
+        if area not in self.area_index or days < 1 or days > self.horizon:
+            return None
+        return int(self.predict([area], days)[area][-1])
+
+    def rates(self, area: str):
+        """
+        :param area: Name of the area
+        :return: Tuple with the estimated daily rates (green -> half ripened, half ripened -> fully ripened)
+        or None if the area is unknown
+        """
+        row = self.area_index.get(area)
+        if row is None:
+            return None
+        return float(self._rates[row, 0]), float(self._rates[row, 1])
+
+
+forecaster = HarvestForecaster()
@@ -0,0 +1,297 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from local_sinks import LocalFTPSink, LocalSMTPSink
+
+
+class SimulatedCamera:
+    """
+    Stand-in for cv2.VideoCapture which delivers frames in real time at the given fps, like a live camera.
+    Frames which are not read in time are dropped and counted
+    :param source: Path to a video file which is looped. If None, synthetic frames are used
+    :param fps: Frames per second of the camera
+    :param width: Width of the synthetic frames
+    :param height: Height of the synthetic frames
+    """
+
+    def __init__(self, source: str = None, fps: float = 1.0, width: int = 1280, height: int = 720):
+        self.fps = fps
+        self.capture = None
+        self.frames = None
+        if source is not None:
+            self.capture = cv2.VideoCapture(source)
+            if not self.capture.isOpened():
+                raise ValueError(f'Can not open video {source}!')
+        else:
+            # A few pre-generated frames, so generating them does not count as load
+            self.frames = [np.random.randint(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(8)]
+
+        self.index = 0
+        self.dropped = 0
+        self.start = None
+
+    def _next_frame(self):
+        if self.frames is not None:
+            return self.frames[self.index % len(self.frames)]
+        ret, frame = self.capture.read()
+        if not ret:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.capture.read()
+        return frame
+
+    def read(self):
+        now = time.perf_counter()
+        if self.start is None:
+            self.start = now
+        due = self.start + self.index / self.fps
+        if now < due:
+            time.sleep(due - now)
+        else:
+            missed = int((now - due) * self.fps)
+            self.dropped += missed
+            self.index += missed
+        frame = self._next_frame()
+        self.index += 1
+        return frame is not None, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.index
+        return 0
+
+    def release(self):
+        if self.capture is not None:
+            self.capture.release()
+
+
+def _use_local_sinks(settings: dict):
+    """
+    Points the config to the local stand-ins. Has to be called before the modules which create the
+    database writer, the ftp server and the email client are imported
+    """
+    from config import database_config, ftp_config, email_config
+
+    database_config.use_database = True
+    database_config.URL = settings['database_url']
+
+    ftp_config.use_ftp = settings['ftp_port'] is not None
+    ftp_config.server = '127.0.0.1'
+    ftp_config.port = settings['ftp_port']
+    ftp_config.user = 'loadtest'
+    ftp_config.password = 'loadtest'
+
+    email_config.smtp_server = '127.0.0.1'
+    email_config.port = settings['smtp_port']
+
+
+def _limit_threads(threads: int):
+    """
+    Limits the threads of torch and OpenCV in this process, so the cameras do not each start a thread pool
+    with all the cores and fight over them. Has to be called before torch is imported
+    """
+    for variable in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[variable] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+
+
+def _available_cores() -> int:
+    """Returns the cores this process may run on, which can be fewer than the cores of the machine"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _camera_worker(camera: int, settings: dict, barrier, results):
+    """Runs one simulated camera through the real VideoProcessor path in its own process"""
+    _use_local_sinks(settings)
+    try:
+        _limit_threads(settings['threads_per_camera'])
+        from memory_manager import memory_monitor, SHED
+        from video_processing import VideoProcessor
+
+        processor = VideoProcessor(video_source=settings['source'] or f'simulated_{camera}')
+        processor.cap.release()
+        processor.cap = SimulatedCamera(settings['source'], settings['fps'], settings['width'], settings['height'])
+
+        # Warm up the models
+        ret, frame = processor.cap.read()
+        processor.process_frame(frame)
+    except Exception as e:
+        # Release the other cameras waiting at the barrier
+        barrier.abort()
+        results.put({'error': f'Camera {camera} failed to start: {e}'})
+        return
+
+    # Start all cameras together
+    try:
+        barrier.wait(timeout=settings['startup_timeout'])
+    except threading.BrokenBarrierError:
+        results.put({'error': f'Camera {camera} stopped, another camera failed to start in time'})
+        return
+    processor.cap.start = None
+    processor.cap.dropped = 0
+
+    latencies, errors = [], 0
+    end = time.perf_counter() + settings['duration']
+    while time.perf_counter() < end:
+        ret, frame = processor.cap.read()
+        if not ret:
+            break
+        start = time.perf_counter()
+        processor.recorder.push(frame)
+        if memory_monitor.check() == SHED:
+            processor.cap.dropped += 1
+            continue
+        try:
+            processor.process_frame(frame)
+        except Exception as e:
+            errors += 1
+            print(f'Camera {camera}: {e}')
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    processor.cap.release()
+    processor.recorder.close()
+    results.put({'latencies': latencies, 'dropped': processor.cap.dropped, 'errors': errors})
+
+
+def run_level(cameras: int, settings: dict) -> dict:
+    """
+    Runs the given number of simulated cameras at the same time and gathers their statistics
+    :param cameras: Number of cameras
+    :param settings: Dictionary with the load test settings
+    :return: Dictionary with latency percentiles in ms, processed and dropped frames
+    """
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(cameras)
+    results = context.Queue()
+    workers = [context.Process(target=_camera_worker, args=(camera, settings, barrier, results))
+               for camera in range(cameras)]
+    for worker in workers:
+        worker.start()
+
+    gathered = []
+    deadline = time.perf_counter() + settings['startup_timeout'] + settings['duration'] + 60
+    try:
+        while len(gathered) < cameras:
+            try:
+                result = results.get(timeout=1)
+            except queue.Empty:
+                failed = [worker for worker in workers if worker.exitcode not in (None, 0)]
+                if failed:
+                    raise RuntimeError(f'{len(failed)} camera worker(s) died (exit code {failed[0].exitcode})')
+                if time.perf_counter() > deadline:
+                    raise TimeoutError('Camera workers did not finish in time')
+                continue
+            if 'error' in result:
+                raise RuntimeError(result['error'])
+            gathered.append(result)
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in workers:
+            worker.join()
+
+    latencies = np.array([latency for result in gathered for latency in result['latencies']])
+    processed = len(latencies)
+    dropped = sum(result['dropped'] for result in gathered)
+    return {
+        'cameras': cameras,
+        'processed': processed,
+        'dropped': dropped,
+        'errors': sum(result['errors'] for result in gathered),
+        'drop_ratio': dropped / (processed + dropped) if processed + dropped else 1.0,
+        'p50_ms': float(np.percentile(latencies, 50)) if processed else float('inf'),
+        'p95_ms': float(np.percentile(latencies, 95)) if processed else float('inf'),
+        'max_ms': float(latencies.max()) if processed else float('inf'),
+    }
+
+
+def ramp(settings: dict, start: int = 1, step: int = 1, max_cameras: int = 64,
+         slo_latency_ms: float = 1000, slo_drop_ratio: float = 0.01) -> int:
+    """
+    Adds cameras until the p95 latency or the drop ratio break the SLO
+    :return: The maximum number of cameras which kept the SLO. If the SLO was not broken up to max_cameras,
+    it is only a lower bound
+    """
+    smtp_sink = LocalSMTPSink().start()
+    ftp_sink = LocalFTPSink().start() if settings['use_ftp'] else None
+    settings = dict(settings, smtp_port=smtp_sink.port, ftp_port=ftp_sink.port if ftp_sink else None)
+
+    # Create the SQLite schema once here, so the workers do not race to create the same file
+    _use_local_sinks(settings)
+    from database import Base, writer
+    Base.metadata.create_all(writer.engine)
+
+    sustainable = 0
+    stopped = None  # why the ramp ended before max_cameras
+    cameras = start
+    try:
+        while cameras <= max_cameras:
+            try:
+                stats = run_level(cameras, settings)
+            except (RuntimeError, TimeoutError) as e:
+                print(f'Load test stopped at {cameras} cameras: {e}')
+                stopped = 'error'
+                break
+            print(f'{cameras} cameras: p50 {stats["p50_ms"]:.0f}ms, p95 {stats["p95_ms"]:.0f}ms, '
+                  f'max {stats["max_ms"]:.0f}ms, processed {stats["processed"]}, dropped {stats["dropped"]} '
+                  f'({stats["drop_ratio"]:.1%}), errors {stats["errors"]}')
+            if stats['p95_ms'] > slo_latency_ms or stats['drop_ratio'] > slo_drop_ratio:
+                print(f'SLO broken at {cameras} cameras!')
+                stopped = 'slo'
+                break
+            sustainable = cameras
+            cameras += step
+    finally:
+        smtp_sink.stop()
+        if ftp_sink is not None:
+            ftp_sink.stop()
+
+    cores = _available_cores()
+    per_core = f'{sustainable / cores:.2f} per core, {cores} cores, {settings["threads_per_camera"]} threads per camera'
+    print(f'Emails received: {smtp_sink.received}, files uploaded: {ftp_sink.received if ftp_sink else 0}')
+    if stopped == 'slo':
+        print(f'Maximum sustainable cameras: {sustainable} ({per_core})')
+    elif stopped == 'error':
+        print(f'Limit not found, the load test failed. {sustainable} cameras kept the SLO ({per_core})')
+    else:
+        print(f'Limit not found, the SLO held up to max cameras. At least {sustainable} cameras are sustainable '
+              f'({per_core}), raise --max-cameras to find the limit')
+    return sustainable
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test of the tomato monitoring pipeline with simulated cameras')
+    parser.add_argument('--source', default=None, help='Video file to loop. Synthetic frames are used if not set')
+    parser.add_argument('--fps', type=float, default=1.0, help='Frames per second of each camera')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--duration', type=float, default=60, help='Seconds to run each level')
+    parser.add_argument('--startup-timeout', type=float, default=600,
+                        help='Seconds to wait for all cameras to load their models')
+    parser.add_argument('--start', type=int, default=1, help='Number of cameras to start with')
+    parser.add_argument('--step', type=int, default=1, help='Cameras added on each level')
+    parser.add_argument('--max-cameras', type=int, default=64)
+    parser.add_argument('--threads-per-camera', type=int, default=1,
+                        help='Torch and OpenCV threads of each camera process')
+    parser.add_argument('--slo-latency-ms', type=float, default=1000, help='Maximum p95 latency of a frame')
+    parser.add_argument('--slo-drop-ratio', type=float, default=0.01, help='Maximum part of dropped frames')
+    parser.add_argument('--database', default='loadtest.db', help='SQLite file used instead of MySQL')
+    parser.add_argument('--no-ftp', action='store_true', help='Do not upload the images to the local FTP sink')
+    args = parser.parse_args()
+
+    ramp({'source': args.source, 'fps': args.fps, 'width': args.width, 'height': args.height,
+          'duration': args.duration, 'startup_timeout': args.startup_timeout, 'database_url': f'sqlite:///{args.database}', 'use_ftp': not args.no_ftp,
+          'threads_per_camera': max(1, args.threads_per_camera)},
+         start=args.start, step=args.step, max_cameras=args.max_cameras,
+         slo_latency_ms=args.slo_latency_ms, slo_drop_ratio=args.slo_drop_ratio)
@@ -0,0 +1,221 @@
+import os
+import shutil
+import socket
+import socketserver
+import ssl
+import subprocess
+import tempfile
+import threading
+
+
+class _Sink:
+    """
+    Base for the local stand-ins of the external servers. Runs a threaded TCP server in the background
+    and counts what it receives
+    :param host: Address to listen on
+    :param port: Port to listen on. 0 picks a free port
+    """
+
+    handler = None
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.host = host
+        self.port = port
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.received = 0  # messages or files
+        self.received_bytes = 0
+        self._server = None
+        self._thread = None
+
+    def count(self, connections: int = 0, received: int = 0, received_bytes: int = 0):
+        with self.lock:
+            self.connections += connections
+            self.received += received
+            self.received_bytes += received_bytes
+
+    def start(self):
+        sink = self
+
+        class Handler(self.handler):
+            pass
+
+        Handler.sink = sink
+        self._server = socketserver.ThreadingTCPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class _LineHandler(socketserver.BaseRequestHandler):
+    sink = None
+
+    def setup(self):
+        self.file = self.request.makefile('rb')
+
+    def reply(self, line: str):
+        self.request.sendall(f'{line}\r\n'.encode())
+
+    def read_command(self):
+        line = self.file.readline()
+        if not line:
+            return None, None
+        command = line.decode(errors='replace').strip()
+        verb, _, argument = command.partition(' ')
+        return verb.upper(), argument
+
+
+class _SMTPHandler(_LineHandler):
+    def handle(self):
+        self.sink.count(connections=1)
+        tls_active = False
+        self.reply('220 localhost SMTP sink ready')
+        while True:
+            verb, argument = self.read_command()
+            if verb is None:
+                break
+            if verb == 'EHLO':
+                if self.sink.context is not None and not tls_active:
+                    self.reply('250-localhost')
+                    self.reply('250-STARTTLS')
+                else:
+                    self.reply('250-localhost')
+                self.reply('250 AUTH PLAIN LOGIN')
+            elif verb == 'HELO':
+                self.reply('250 localhost')
+            elif verb == 'STARTTLS' and self.sink.context is not None and not tls_active:
+                self.reply('220 Ready to start TLS')
+                self.request = self.sink.context.wrap_socket(self.request, server_side=True)
+                self.file = self.request.makefile('rb')
+                tls_active = True
+            elif verb == 'AUTH':
+                self.reply('235 Authentication successful')
+            elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                size = 0
+                while True:
+                    line = self.file.readline()
+                    if not line or line == b'.\r\n':
+                        break
+                    size += len(line)
+                self.sink.count(received=1, received_bytes=size)
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                break
+            else:
+                self.reply('502 Command not implemented')
+
+
+class LocalSMTPSink(_Sink):
+    """
+    Accepts and counts emails instead of delivering them.
+    Note: Email.send always uses STARTTLS, so a self-signed certificate is created with `openssl` when it is available.
+    Without it the sink does not offer STARTTLS and only the connections are counted
+    :param certfile: (Optional) Certificate for STARTTLS
+    :param keyfile: (Optional) Key of the certificate
+    """
+
+    handler = _SMTPHandler
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, certfile: str = None, keyfile: str = None):
+        super().__init__(host, port)
+        self.context = None
+        if certfile is None:
+            certfile, keyfile = _self_signed_certificate()
+        if certfile is not None:
+            self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self.context.load_cert_chain(certfile, keyfile)
+        else:
+            print('openssl was not found, the SMTP sink will not offer STARTTLS and emails will not be delivered!')
+
+
+class _FTPHandler(_LineHandler):
+    def data_connection(self, address, passive):
+        if passive is not None:
+            connection, _ = passive.accept()
+            passive.close()
+            return connection
+        return socket.create_connection(address)
+
+    def handle(self):
+        self.sink.count(connections=1)
+        address, passive = None, None
+        self.reply('220 FTP sink ready')
+        while True:
+            verb, argument = self.read_command()
+            if verb is None:
+                break
+            if verb == 'USER':
+                self.reply('331 Password required')
+            elif verb == 'PASS':
+                self.reply('230 Logged in')
+            elif verb == 'TYPE':
+                self.reply('200 Type set')
+            elif verb == 'PORT':
+                numbers = argument.split(',')
+                address = ('.'.join(numbers[:4]), int(numbers[4]) * 256 + int(numbers[5]))
+                self.reply('200 PORT command successful')
+            elif verb == 'PASV':
+                passive = socket.create_server((self.sink.host, 0))
+                host, port = passive.getsockname()[:2]
+                self.reply(f'227 Entering Passive Mode ({host.replace(".", ",")},{port // 256},{port % 256})')
+            elif verb == 'STOR':
+                self.reply('150 Opening data connection')
+                size = 0
+                with self.data_connection(address, passive) as connection:
+                    while True:
+                        chunk = connection.recv(65536)
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                address, passive = None, None
+                self.sink.count(received=1, received_bytes=size)
+                self.reply('226 Transfer complete')
+            elif verb in ('CWD', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'PWD':
+                self.reply('257 "/"')
+            elif verb == 'SYST':
+                self.reply('215 UNIX Type: L8')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                break
+            else:
+                self.reply('502 Command not implemented')
+
+
+class LocalFTPSink(_Sink):
+    """
+    Accepts and counts uploaded files without storing them. Supports both active (PORT) and passive (PASV) mode
+    """
+
+    handler = _FTPHandler
+
+
+def _self_signed_certificate():
+    """
+    Creates a temporary self-signed certificate with the openssl command line tool
+    :return: (certificate path, key path) or (None, None) if openssl is not available
+    """
+    if shutil.which('openssl') is None:
+        return None, None
+    folder = tempfile.mkdtemp(prefix='tomato_sink_')
+    certfile, keyfile = os.path.join(folder, 'cert.pem'), os.path.join(folder, 'key.pem')
+    try:
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                        '-subj', '/CN=localhost', '-keyout', keyfile, '-out', certfile],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return certfile, keyfile
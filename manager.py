@@ -6,6 +6,7 @@ from ultralytics import YOLO
 from chart import draw_chart
 from database import writer, Disease, Growth
 from config import tomato_model_config
+from forecast import forecaster
 from ftp import ftp_config, ftp_server
 
 
@@ -33,14 +34,30 @@ class Detector:
         self.model = YOLO(self.weights, tomato_model_config.device)
         self.results = None
 
+        imgsz = self.model.overrides.get('imgsz', tomato_model_config.image_size)
+        if isinstance(imgsz, (list, tuple)):
+            imgsz = imgsz[0] if len(set(imgsz)) == 1 else None
+        self.imgsz = imgsz  # None when the model does not use a square input
+
     def run(self, input_: str):
         """
         Runs the YOLO model on the input data. Note: Grab .results to get the results from the detection
-        :arg input_: Path to the input source, being image, folder with images, video or stream
+        :arg input_: Path to the input source, being image, folder with images, video or stream.
+        It can also be a preprocessed tensor from preprocessing.preprocess
         """
         if self.results is not None:
             self.results = None
-        self.results = self.model(input_)
+        if self.imgsz is not None:
+            # Explicit size, since the cascade gate may run the same model at a lower size
+            self.results = self.model(input_, imgsz=self.imgsz)
+        else:
+            self.results = self.model(input_)
+
+    def release(self):
+        """
+        Drops the results of the last run (they hold the original images). Call it once analysis finishes
+        """
+        self.results = None
 
 
 class Analyzer:
@@ -121,6 +138,14 @@ class Analyzer:
                 ftp_server.send_image_data_from_result(result,filename)
                 ftp_server.ftp.quit()
 
+    def release(self):
+        """
+        Drops the references to the detector results and everything gathered from them
+        """
+        self.results = None
+        self.confidences = []
+        self.counts = []
+
     def is_any_confidence_more_than(self, min_threshold):
         return any(float(value) > min_threshold for d in self.confidences for value in d.keys())
 
@@ -166,14 +191,30 @@ class Analyzer:
 
         return False
 
-    def estimate_next_ready_tomatoes(self):
+    def estimate_next_ready_tomatoes(self, area: str = 'unidentified'):
+        """
+        Prints the forecast for ready tomatoes in the area, based on the history kept by the forecaster.
+        Falls back to the rough 5 to 7 days estimation when there is no history for the area
+        :param area: Name of the area
+        :return: Dictionary in format {date: predicted ready count} or None when the fallback was used
+        """
         # TODO: for more exact calculations can be used temperature data
-        half_ripened_count = [value for detection in self.counts for key, value in detection.items() if 'half' in key]
-        five_days_date = datetime.datetime.now().date() + datetime.timedelta(days=5)
-        seven_days_date = datetime.datetime.now().date() + datetime.timedelta(days=7)
-        message = f'{sum(half_ripened_count)} tomatoes are estimated to be ready in 5 to 7 days ' \
-                  f'(between {five_days_date} and {seven_days_date})'
-        print(message)
+        forecast = forecaster.predict([area]).get(area)
+        if forecast is None:
+            half_ripened_count = [value for detection in self.counts for key, value in detection.items() if 'half' in key]
+            five_days_date = datetime.datetime.now().date() + datetime.timedelta(days=5)
+            seven_days_date = datetime.datetime.now().date() + datetime.timedelta(days=7)
+            message = f'{sum(half_ripened_count)} tomatoes are estimated to be ready in 5 to 7 days ' \
+                      f'(between {five_days_date} and {seven_days_date})'
+            print(message)
+            return None
+
+        today = datetime.datetime.now().date()
+        by_day = {today + datetime.timedelta(days=day + 1): int(count) for day, count in enumerate(forecast)}
+        last_date = max(by_day)
+        print(f'{by_day[last_date]} tomatoes in area {area} are estimated to be ready by {last_date}')
+        print(f'Forecast by day: {", ".join(f"{date}: {count}" for date, count in by_day.items())}')
+        return by_day
 
 
 class Update:
@@ -190,7 +231,7 @@ class Update:
         :param detected: A list with all dictionaries in format {illness: count}
         :return:
         """
-        date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        date = datetime.datetime.now()
         area = 'unidentified'  #TODO: there will be need for area to be taken from another data structure. Maybe
                                # something like {area: {illness: count}}. Also the name of the picture can be the
                                # name of the area for simplicity
@@ -218,7 +259,7 @@ class Update:
         This method iterates over the detection results and classifies the tomatoes into three categories based on their ripeness: green, half-ripened, and fully ripened. The counts for each category are accumulated, and the results are written to the database along with the current timestamp and area information.
 
         The function assumes that the detection result is a list of dictionaries, where each dictionary contains key-value pairs representing tomato states (e.g., 'l_green', 'b_green' for green tomatoes, 'l_half_ripened', 'b_half_ripened' for half-ripened, and 'l_fully_ripened', 'b_fully_ripened' for fully ripened). The values in these keys represent the count of tomatoes in each respective category."""
-        date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        date = datetime.datetime.now()
         area = 'unidentified'  #TODO: there will be need for area to be taken from another data structure. Maybe
                                # something like {area: {illness: count}}. Also the name of the picture can be the
                                # name of the area for simplicity
@@ -247,6 +288,7 @@ class Update:
             half_ripened_count=half,
             fully_ripened_count=ready
         )
+        forecaster.update(area, date, green, half, ready)
         #IMPORTANT: for now it adds all detected tomatoes, regardless of the confidence!
 
 
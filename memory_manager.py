@@ -0,0 +1,180 @@
+import datetime
+import gc
+import os
+import signal
+import sys
+import time
+import tracemalloc
+
+from config import memory_config
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+OK = 'ok'
+WARN = 'warn'
+SHED = 'shed'
+
+
+def get_rss_mb() -> float:
+    """
+    Returns the resident memory of the current process in megabytes.
+    Uses psutil when it is installed, otherwise reads /proc on Linux
+    :return: RSS in megabytes or None if it can not be measured on this platform
+    """
+    if psutil is not None:
+        return psutil.Process(os.getpid()).memory_info().rss / (1024 * 1024)
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class MemoryMonitor:
+    """
+    Tracks the memory of the process against the configured budget for long-running mode
+    :param budget_mb: Budget in megabytes. Defaults to the one in the config
+    """
+
+    def __init__(self, budget_mb: int = None):
+        self.enabled = memory_config.long_running
+        self.budget_mb = budget_mb if budget_mb is not None else memory_config.budget_mb
+        self.warn_mb = self.budget_mb * memory_config.warn_ratio
+        self.shed_mb = self.budget_mb * memory_config.shed_ratio
+        self.snapshot_folder = memory_config.snapshot_folder
+        self.status_interval = memory_config.status_interval
+        self.last_status = time.time()
+
+        self.rss_mb = None
+        self.peak_rss_mb = 0.0
+        self.shed_count = 0  # frames that were skipped because of the budget
+        self.last_snapshot = None
+        self.status_requested = False  # set by SIGUSR1, served on the next check
+
+        if self.enabled and memory_config.use_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+
+        # `kill -USR1 <pid>` prints the memory status of the running process and saves a snapshot on the next check
+        if self.enabled and hasattr(signal, 'SIGUSR1'):
+            try:
+                signal.signal(signal.SIGUSR1, self._on_signal)
+            except ValueError:
+                pass  # not in the main thread
+
+    def _on_signal(self, signum, frame):
+        # Only set a flag, printing or writing files inside a signal handler can fail with a reentrant call
+        self.status_requested = True
+
+    def check(self) -> str:
+        """
+        Measures RSS and compares it with the budget. Forces garbage collection when over the warning level
+        and saves a snapshot (if tracemalloc is enabled) the first time the shed level is reached.
+        The status is printed every `status_interval` seconds and after SIGUSR1, which also saves a snapshot
+        :return: 'ok', 'warn' or 'shed'
+        """
+        if not self.enabled:
+            return OK
+
+        self.rss_mb = get_rss_mb()
+        if self.rss_mb is not None:
+            self.peak_rss_mb = max(self.peak_rss_mb, self.rss_mb)
+
+        if self.status_requested:
+            self.status_requested = False
+            self.log_status()
+            if tracemalloc.is_tracing():
+                self.take_snapshot()
+        elif self.status_interval > 0 and time.time() - self.last_status >= self.status_interval:
+            self.log_status()
+
+        if self.rss_mb is None:
+            return OK
+
+        if self.rss_mb < self.warn_mb:
+            return OK
+
+        gc.collect()
+        self.rss_mb = get_rss_mb()
+
+        if self.rss_mb >= self.shed_mb:
+            self.shed_count += 1
+            print(f'Memory {self.rss_mb:.0f}MB is over {self.shed_mb:.0f}MB '
+                  f'(budget {self.budget_mb}MB), skipping frame!')
+            if self.shed_count == 1 and tracemalloc.is_tracing():
+                self.take_snapshot()
+            return SHED
+
+        if self.rss_mb >= self.warn_mb:
+            print(f'Warning: memory {self.rss_mb:.0f}MB is close to the budget of {self.budget_mb}MB')
+            return WARN
+
+        return OK
+
+    def take_snapshot(self, path: str = None) -> str:
+        """
+        Saves a tracemalloc snapshot to a file which can be compared later with `python memory_manager.py diff`
+        :param path: (Optional) Path of the snapshot file. Defaults to a timestamped file in the snapshot folder
+        :return: Path to the saved snapshot or None if tracemalloc is not running
+        """
+        if not tracemalloc.is_tracing():
+            print('tracemalloc is not running! Enable it with `tracemalloc = True` in the [memory] section.')
+            return None
+
+        if path is None:
+            os.makedirs(self.snapshot_folder, exist_ok=True)
+            stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+            path = os.path.join(self.snapshot_folder, f'snapshot_{stamp}.tracemalloc')
+
+        tracemalloc.take_snapshot().dump(path)
+        self.last_snapshot = path
+        print(f'Memory snapshot saved at: {path}')
+        return path
+
+    def status(self) -> dict:
+        return {
+            'rss_mb': self.rss_mb,
+            'peak_rss_mb': self.peak_rss_mb,
+            'budget_mb': self.budget_mb,
+            'shed_count': self.shed_count,
+        }
+
+    def log_status(self):
+        """
+        Prints the current and peak RSS, the budget and how many frames were skipped so far
+        """
+        self.last_status = time.time()
+        rss = f'{self.rss_mb:.0f}MB' if self.rss_mb is not None else 'unknown'
+        print(f'Memory: RSS {rss}, peak {self.peak_rss_mb:.0f}MB, budget {self.budget_mb}MB, '
+              f'{self.shed_count} frames skipped')
+
+
+def diff_snapshots(old_path: str, new_path: str, limit: int = 20, key_type: str = 'lineno') -> list:
+    """
+    Compares two saved tracemalloc snapshots and prints the places where memory grew the most
+    :param old_path: Path to the older snapshot
+    :param new_path: Path to the newer snapshot
+    :param limit: Number of lines to print
+    :param key_type: How to group allocations, 'lineno', 'filename' or 'traceback'
+    :return: List with the printed statistics
+    """
+    old = tracemalloc.Snapshot.load(old_path)
+    new = tracemalloc.Snapshot.load(new_path)
+    stats = new.compare_to(old, key_type)[:limit]
+    for stat in stats:
+        print(stat)
+    return stats
+
+
+memory_monitor = MemoryMonitor()
+
+if __name__ == '__main__':
+    # Usage: python memory_manager.py diff old.tracemalloc new.tracemalloc [limit]
+    # Note: To see the memory status of a running process, use `kill -USR1 <pid>`
+    if len(sys.argv) >= 4 and sys.argv[1] == 'diff':
+        diff_snapshots(sys.argv[2], sys.argv[3], int(sys.argv[4]) if len(sys.argv) > 4 else 20)
+    else:
+        print('Usage: python memory_manager.py diff <old snapshot> <new snapshot> [limit]')
@@ -0,0 +1,50 @@
+import cv2
+import numpy as np
+import torch
+
+
+def letterbox(frame, size: int = 640, stride: int = 32, color: tuple = (114, 114, 114)):
+    """
+    Resizes the frame keeping its aspect ratio so the longer side fits the given size, and pads it only up
+    to a multiple of the stride, the same way ultralytics does it before prediction (e.g. 384x640 for 16:9 frames)
+    :param frame: BGR image as numpy array
+    :param size: Target size of the longer side
+    :param stride: Model stride
+    :param color: Color of the padding
+    :return: The letterboxed BGR image
+    """
+    height, width = frame.shape[:2]
+    ratio = min(size / height, size / width)
+    new_width, new_height = round(width * ratio), round(height * ratio)
+
+    if (new_width, new_height) != (width, height):
+        frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+
+    pad_width, pad_height = (-new_width % stride) / 2, (-new_height % stride) / 2
+    top, bottom = round(pad_height - 0.1), round(pad_height + 0.1)
+    left, right = round(pad_width - 0.1), round(pad_width + 0.1)
+    if not (top or bottom or left or right):
+        return frame
+    return cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+
+
+def to_tensor(frame):
+    """
+    Converts a letterboxed BGR image to a normalised RGB tensor in BCHW format, which YOLO takes as it is
+    :param frame: Letterboxed BGR image as numpy array
+    :return: torch.Tensor with shape (1, 3, H, W) and values between 0 and 1
+    """
+    image = np.ascontiguousarray(frame[..., ::-1].transpose(2, 0, 1))  # BGR to RGB, HWC to CHW
+    return torch.from_numpy(image).unsqueeze(0).float().div_(255.0)
+
+
+def preprocess(frame, size: int = 640, stride: int = 32):
+    """
+    Letterboxes the frame and converts it to the model input, so it can be done once and passed to every
+    model with the same input size
+    :param frame: BGR image as numpy array
+    :param size: Input size of the models
+    :param stride: Model stride
+    :return: torch.Tensor ready to be passed to the model
+    """
+    return to_tensor(letterbox(frame, size, stride))
@@ -0,0 +1,214 @@
+import collections
+import datetime
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from config import recorder_config
+
+
+class Event:
+    """
+    A clip which is still collecting frames after the event happened
+    :param name: Name of the event, for example 'disease' or 'harvest'
+    :param frames: The pre-roll frames in format [(timestamp, jpeg bytes)]
+    :param end_time: Time after which the clip is complete
+    """
+
+    def __init__(self, name: str, frames: list, end_time: float):
+        self.name = name
+        self.frames = frames
+        self.end_time = end_time
+        self.started = datetime.datetime.now()
+        self.size = sum(len(data) for _, data in frames)  # bytes
+        self.truncated = False
+        self.number = 0
+
+
+class EventRecorder:
+    """
+    Keeps a ring buffer with JPEG compressed recent frames of one camera and writes a clip
+    around each event (disease, harvest ...) on a background thread.
+    Note: The budget covers the ring buffer, the running events and the clips waiting to be written.
+    Frames shared between them are counted for each, so the real memory stays below it.
+    Clips have priority: the oldest buffered frames are dropped first, and a running clip stops collecting
+    frames only when the clips alone fill the budget
+    :param camera: Name of the camera, used in the clip file names
+    """
+
+    def __init__(self, camera: str = 'camera'):
+        self.camera = ''.join(c if c.isalnum() else '_' for c in str(camera)).strip('_') or 'camera'
+        self.enabled = recorder_config.use_recorder
+        self.pre_seconds = recorder_config.pre_seconds
+        self.post_seconds = recorder_config.post_seconds
+        self.fps = recorder_config.fps
+        self.budget_bytes = recorder_config.budget_mb * 1024 * 1024
+        self.quality = recorder_config.quality
+        self.output = recorder_config.output
+
+        self.buffer = collections.deque()  # [(timestamp, jpeg bytes)]
+        self.buffer_bytes = 0
+        self.events = []  # events still collecting post-roll frames
+        self.event_bytes = 0  # bytes of running events and of clips waiting to be written
+        self._lock = threading.Lock()
+        self.last_push = 0.0
+        self.clip_count = 0
+        self.dropped_clips = 0
+
+        self._queue = queue.Queue(maxsize=recorder_config.max_pending_clips)
+        self._thread = None
+        if self.enabled:
+            self._thread = threading.Thread(target=self._encode_clips, name=f'recorder-{self.camera}', daemon=True)
+            self._thread.start()
+
+    def push(self, frame, timestamp: float = None):
+        """
+        Adds the frame to the ring buffer (and to the running events). Frames faster than the configured fps are skipped
+        :param frame: BGR image as numpy array
+        :param timestamp: (Optional) Time of the frame. Defaults to the current time
+        :return:
+        """
+        if not self.enabled:
+            return
+        timestamp = timestamp if timestamp is not None else time.time()
+        if timestamp - self.last_push < 1 / self.fps:
+            return
+        self.last_push = timestamp
+
+        success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not success:
+            return
+        data = buffer.tobytes()
+
+        for event in self.events:
+            if event.truncated:
+                continue
+            with self._lock:
+                fits = self.event_bytes + len(data) <= self.budget_bytes
+                if fits:
+                    self.event_bytes += len(data)
+            if fits:
+                event.frames.append((timestamp, data))
+                event.size += len(data)
+            else:
+                event.truncated = True
+                print(f'Recorder budget is full, {event.name} clip for {self.camera} is cut short!')
+
+        self.buffer.append((timestamp, data))
+        self.buffer_bytes += len(data)
+        self._trim(timestamp)
+
+        self._finish_events(timestamp)
+
+    def _trim(self, timestamp: float):
+        """Drops the oldest buffered frames while over the budget or older than the pre-roll"""
+        while self.buffer and (self.buffer_bytes + self.event_bytes > self.budget_bytes
+                               or timestamp - self.buffer[0][0] > self.pre_seconds):
+            self.buffer_bytes -= len(self.buffer.popleft()[1])
+
+    def trigger(self, name: str, timestamp: float = None):
+        """
+        Starts a clip with the buffered pre-roll. The clip is written after the post-roll time passes.
+        If a clip for the same event is still running, it is extended instead
+        :param name: Name of the event
+        :param timestamp: (Optional) Time of the event. Defaults to the current time
+        :return:
+        """
+        if not self.enabled:
+            return
+        timestamp = timestamp if timestamp is not None else time.time()
+
+        for event in self.events:
+            if event.name == name:
+                event.end_time = max(event.end_time, timestamp + self.post_seconds)
+                return
+
+        # Take the newest buffered frames which still fit next to the other clips
+        with self._lock:
+            available = self.budget_bytes - self.event_bytes
+        frames, size = [], 0
+        for frame in reversed(self.buffer):
+            if size + len(frame[1]) > available:
+                break
+            frames.append(frame)
+            size += len(frame[1])
+        frames.reverse()
+
+        event = Event(name, frames, timestamp + self.post_seconds)
+        with self._lock:
+            self.event_bytes += event.size
+        self._trim(timestamp)
+        self.clip_count += 1
+        event.number = self.clip_count
+        print(f'Recording {name} event clip for {self.camera}...')
+        self.events.append(event)
+
+    def _finish_events(self, timestamp: float):
+        running = []
+        for event in self.events:
+            if timestamp >= event.end_time:
+                self._submit(event)
+            else:
+                running.append(event)
+        self.events = running
+
+    def _submit(self, event: Event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._release(event)
+            self.dropped_clips += 1
+            print(f'Too many clips are waiting to be written, {event.name} clip for {self.camera} is dropped!')
+
+    def _encode_clips(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                break
+            try:
+                self._write_clip(event)
+            except Exception as e:
+                print(f'Error when writing {event.name} clip for {self.camera}: {e}')
+            finally:
+                self._release(event)
+
+    def _release(self, event: Event):
+        with self._lock:
+            self.event_bytes -= event.size
+        event.frames = []
+        event.size = 0
+
+    def _write_clip(self, event: Event):
+        if not event.frames:
+            return
+        os.makedirs(self.output, exist_ok=True)
+        stamp = event.started.strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(self.output, f'{self.camera}_{event.name}_{stamp}_{event.number}.mp4')
+
+        writer = None
+        for _, data in event.frames:
+            frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if writer is None:
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), self.fps, (width, height))
+            writer.write(frame)
+        writer.release()
+        print(f'Clip saved at: {path}')
+
+    def close(self):
+        """
+        Writes the clips of the running events with what they have collected and waits for the encoding to finish
+        """
+        if not self.enabled:
+            return
+        for event in self.events:
+            self._submit(event)
+        self.events = []
+        self._queue.put(None)
+        self._thread.join()
+        self.buffer.clear()
+        self.buffer_bytes = 0
@@ -1,8 +1,14 @@
 import cv2
 import time
-from config import tomato_model_config, chart_config
+from cascade import CascadeGate
+from config import tomato_model_config, chart_config, cascade_config
 from manager import Detector, Analyzer, update
+from database import writer
 from email_manager import email
+from forecast import forecaster
+from memory_manager import memory_monitor, SHED
+from preprocessing import preprocess
+from recorder import EventRecorder
 
 
 class VideoProcessor:
@@ -18,39 +24,94 @@ class VideoProcessor:
         self.cap = cv2.VideoCapture(video_source)
         self.save_frames_path = tomato_model_config.output_folder
         self.draw_chart = chart_config.save
+        self.recorder = EventRecorder(camera=video_source)
+        self.alert_cooldown = tomato_model_config.alert_cooldown
+        self.last_alerts = {}  # {event name: time of the last alert}
 
         # Initialize detectors and analyzers
         self.tomato_size_detection = Detector(weights_path=tomato_model_config.size_tomato_model_path)
         self.tomato_disease_detection = Detector(weights_path=tomato_model_config.disease_tomato_model_path)
 
+        # Restore the harvest forecast from the recent growth records
+        if not forecaster.areas:
+            forecaster.load_history()
+
+        # Share one preprocessed tensor between both models when they take the same input size
+        self.shared_size = None
+        if tomato_model_config.shared_preprocessing:
+            size = self.tomato_size_detection.imgsz
+            if size is not None and size == self.tomato_disease_detection.imgsz:
+                self.shared_size = size
+            else:
+                print('Models use different input sizes, shared preprocessing is disabled!')
+
+        # Optional fast first pass, the full detectors run only on the frames it flags
+        self.gate = None
+        self.state_interval = cascade_config.state_interval
+        self.last_state_time = 0.0
+        if cascade_config.use_cascade:
+            self.gate = CascadeGate(models=[self.tomato_disease_detection.model, self.tomato_size_detection.model])
+
     def process_frame(self, frame):
         """
         Process a single frame to detect diseases and tomato size.
+        If the cascade is enabled, the frame goes through the gate first and can be skipped.
+        Skipped frames still run the full detectors every 'state_interval' seconds, so the growth table and
+        the harvest forecast do not receive only the frames the gate flagged.
 
         :param frame: The video frame to process.
         """
+        if self.gate is None:
+            return self.detect(frame)
+
+        audited = False
+        if not self.gate.passes(frame):
+            state_due = self.state_interval > 0 and time.time() - self.last_state_time >= self.state_interval
+            if not state_due and not self.gate.should_audit():
+                return "frame_skipped"
+            audited = True
+
+        start = time.perf_counter()
+        result = self.detect(frame)
+        self.gate.track_full(time.perf_counter() - start, found=result != "frame_processed", audited=audited)
+        return result
+
+    def detect(self, frame):
+        """
+        Runs the full disease and size detectors on a single frame.
+
+        :param frame: The video frame to process.
+        :return: "disease_detected", "harvest_ready" or "frame_processed"
+        """
         frame_index = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES)) - 1
+        input_ = preprocess(frame, self.shared_size) if self.shared_size is not None else frame
 
         # Run disease detection
-        self.tomato_disease_detection.run(input_=frame)
+        self.tomato_disease_detection.run(input_=input_)
         analyze_for_disease = Analyzer(self.tomato_disease_detection.results, self.tomato_disease_detection.model)
         analyze_for_disease.analyze_results(
             identification_name=f'{frame_index}_disease',
             save_path=self.save_frames_path,
             draw_charts=self.draw_chart)
+        if memory_monitor.enabled:
+            self.tomato_disease_detection.release()
 
         # Check for illness
-        if analyze_for_disease.check_for_illness(tomato_model_config.disease_tomato_confidence):
-            email.send("Disease is detected!")
-            return "disease_detected"
+        is_ill = analyze_for_disease.check_for_illness(tomato_model_config.disease_tomato_confidence)
+        analyze_for_disease.release()
+        if is_ill:
+            # The alert is rate limited, the state of the tomatoes is still analysed below
+            self.alert('disease', "Disease is detected!")
 
         # Run size detection
-        self.tomato_size_detection.run(input_=frame)
+        self.tomato_size_detection.run(input_=input_)
         analyze_sizes = Analyzer(self.tomato_size_detection.results, self.tomato_size_detection.model)
         analyze_sizes.analyze_results(
             identification_name=f'{frame_index}_size',
             save_path=self.save_frames_path,
             draw_charts=self.draw_chart)
+        if memory_monitor.enabled:
+            self.tomato_size_detection.release()
 
         # Count ready tomatoes
         ready_tomatoes_count = analyze_sizes.check_for_ready_tomatoes(
@@ -59,15 +120,41 @@ class VideoProcessor:
 
         if ready_tomatoes_count is not False:
             message = f'There are {ready_tomatoes_count} ready tomatoes to be harvested!'
-            print(f'Sending message: {message}')
-            email.send(message)
+            self.alert('harvest', message)
 
         # Notify the state of the tomatoes
         update.for_tomato_state(analyze_sizes.counts)
+        self.last_state_time = time.time()
         analyze_sizes.estimate_next_ready_tomatoes()
+        analyze_sizes.release()
 
+        if is_ill:
+            return "disease_detected"
+        if ready_tomatoes_count is not False:
+            return "harvest_ready"
         return "frame_processed"
 
+    def alert(self, name: str, message: str):
+        """
+        Sends the email and records the event clip, at most once per 'alert_cooldown' seconds for each event name,
+        so a lasting disease or harvest condition does not alert on every processed frame.
+
+        :param name: Name of the event, for example 'disease' or 'harvest'
+        :param message: The message for the email
+        :return: True if the alert was sent
+        """
+        now = time.time()
+        last = self.last_alerts.get(name)
+        if last is not None and now - last < self.alert_cooldown:
+            print(f'{name} alert was sent {now - last:.0f} seconds ago, skipping it.')
+            return False
+        self.last_alerts[name] = now
+
+        print(f'Sending message: {message}')
+        email.send(message)
+        self.recorder.trigger(name, now)
+        return True
+
     def start_processing(self):
         """
         Start the video processing loop.
@@ -83,11 +170,14 @@ class VideoProcessor:
                 break
 
             current_time = time.time()
+            self.recorder.push(frame, current_time)
             if current_time - last_processed_time >= self.frame_interval:
-                print(f"Processing frame at {current_time} seconds...")
-                result = self.process_frame(frame)
-                if result == "disease_detected":
-                    break
+                if memory_monitor.check() == SHED:
+                    # Skip this frame and give the memory a chance to go down before the next one
+                    writer.recycle_session()
+                else:
+                    print(f"Processing frame at {current_time} seconds...")
+                    self.process_frame(frame)
                 last_processed_time = current_time
 
             # Optional: Display the frame (for debugging purposes)
@@ -99,6 +189,9 @@ class VideoProcessor:
 
         # Clean up and release resources
         self.cap.release()
+        self.recorder.close()
+        if self.gate is not None:
+            self.gate.report()
         cv2.destroyAllWindows()
 
 